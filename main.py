@@ -1,8 +1,28 @@
-from qiskit import QuantumCircuit, transpile
+from qiskit import QuantumCircuit
 from qiskit_aer import AerSimulator
-from qiskit.circuit.library import DiagonalGate
-import math
+from functools import lru_cache
 import random
+import sys
+
+import numpy as np
+
+# Per-scan and per-probe output; set to False to skip it (e.g. when benchmarking)
+VERBOSE = True
+
+# One simulator shared by every scan instead of building one per call.
+# The scans of a batched job are independent, so Aer may run them in parallel.
+_SIM = AerSimulator(method="statevector", max_parallel_experiments=0)
+
+# Halves of the scan circuit around the oracle, keyed by n_qubits
+_SCAN_TEMPLATES = {}
+
+# Source of the sampled shots; rebind to a seeded generator to reproduce scans
+_RNG = np.random.default_rng()
+
+def _num_qubits(length):
+    """Returns the qubits needed to index a line of the given length (at least 1)."""
+    return max(1, (length - 1).bit_length())
+
 
 def create_oracle(line_data):
     """
@@ -12,34 +32,185 @@ def create_oracle(line_data):
     negative phase (i.e., applies a Z gate).
     
     Args:
-        line_data (list): A list of 0s (miss) and 1s (ship).
+        line_data (list or np.ndarray): A line of 0s (miss) and 1s (ship).
     
     Returns:
         qiskit.circuit.Gate: The oracle gate.
     """
-    if not line_data:
+    if len(line_data) == 0:
         # Handle empty line data
-        return DiagonalGate([1])
+        return QuantumCircuit(0, name="oracle").to_gate()
         
-    n_qubits = math.ceil(math.log2(len(line_data)))
-    if n_qubits == 0: # Happens if len(line_data) == 1
-        n_qubits = 1
-    
-    # Create a diagonal matrix for the phase flip.
-    # Start with all 1s (no phase flip).
-    phases = [1] * (2**n_qubits)
-    
-    # Add -1 (phase flip) for each 'ship' location
-    for i, has_ship in enumerate(line_data):
-        if has_ship:
-            if i < len(phases):
-                phases[i] = -1
+    n_qubits = _num_qubits(len(line_data))
+    ship_idx = np.flatnonzero(np.asarray(line_data[:1 << n_qubits], dtype=np.int8))
+    return _oracle_gate(n_qubits, tuple(ship_idx.tolist()))
+
+
+@lru_cache(maxsize=256)
+def _oracle_gate(n_qubits, ship_idx):
+    """
+    Builds the oracle gate flipping the phase of each index in ship_idx.
+    
+    Many lines repeat (empty ones especially), so gates are cached by
+    (n_qubits, ship_idx) and shared; callers only ever append them.
+    """
+    oracle = QuantumCircuit(n_qubits, name="oracle")
+    
+    # Flip the phase of |i> for each 'ship' location i: X gates on the
+    # 0 bits of i map it to |11...1>, which a multi-controlled Z marks.
+    for i in ship_idx:
+        zero_bits = [q for q in range(n_qubits) if not (i >> q) & 1]
+        if zero_bits:
+            oracle.x(zero_bits)
+        if n_qubits == 1:
+            oracle.z(0)
+        else:
+            oracle.mcp(np.pi, list(range(n_qubits - 1)), n_qubits - 1)
+        if zero_bits:
+            oracle.x(zero_bits)
                 
-    return DiagonalGate(phases)
+    return oracle.to_gate()
+
+
+def _scan_template(n_qubits):
+    """
+    Returns the halves of the scan circuit for n_qubits.
+    
+    Only the oracle differs between scans, so the Hadamard layer before it
+    and the Hadamard layer and readout after it are built once and callers
+    compose their oracle in between. Every instruction is native to
+    AerSimulator, so the circuits are never transpiled.
+    
+    Instead of measuring, the readout saves P(|00...0>) from the final
+    statevector, which is exact on the noiseless simulator.
+    """
+    if n_qubits not in _SCAN_TEMPLATES:
+        # 1. Create superposition of all positions
+        prep = QuantumCircuit(n_qubits)
+        prep.h(range(n_qubits))
+        
+        # 2. The "bomb" oracle goes here
+        
+        # 3. Apply interference, then 4. read out P(|00...0>)
+        readout = QuantumCircuit(n_qubits)
+        readout.h(range(n_qubits))
+        readout.save_amplitudes_squared([0])
+        
+        _SCAN_TEMPLATES[n_qubits] = (prep, readout)
+    return _SCAN_TEMPLATES[n_qubits]
+
+
+def build_scan_circuit(line_data):
+    """
+    Builds the ready-to-run scan circuit for a non-empty line.
+    
+    Args:
+        line_data (list or np.ndarray): A line of 0s (miss) and 1s (ship).
+        
+    Returns:
+        tuple: The runnable circuit, which saves P(|00...0>) as
+            "amplitudes_squared", and its number of qubits.
+    """
+    # Determine number of qubits needed to represent the line
+    n_qubits = _num_qubits(len(line_data))
+
+    # The oracle is built from X and (multi-controlled) phase gates that
+    # the simulator runs natively, so its definition is spliced in as is
+    prep, readout = _scan_template(n_qubits)
+    qc = prep.compose(create_oracle(line_data).definition)
+    qc.compose(readout, inplace=True)
+    return qc, n_qubits
+
+
+def _scan_result(miss_counts, shots):
+    """Turns the number of '00...0' measurements into "DETECT" or "MISS"."""
+    # If the number of "MISS" counts is less than the total shots,
+    # it means we must have measured *something else* at least once.
+    if miss_counts < shots:
+        # Measuring *any* other state is a "DETECT"
+        return "DETECT"
+    else:
+        # Only if every shot was '00...0' do we call it a "MISS"
+        return "MISS"
+
+
+def _miss_probability(ship_counts, length):
+    """
+    Returns the exact P(MISS) of scanning lines of equal length.
+    
+    With a phase-only oracle between two Hadamard layers, the amplitude
+    of |00...0> is the mean of the oracle phases. For k ships among
+    N = 2^n positions this gives P(MISS) = ((N - 2k) / N)^2, so the
+    simulator is not needed.
+    
+    Args:
+        ship_counts (np.ndarray): Number of ships on each line.
+        length (int): The length of every line.
+        
+    Returns:
+        tuple: P(MISS) for each line, and the number of qubits used.
+    """
+    n_qubits = _num_qubits(length)
+    N = 2**n_qubits
+    ship_counts = np.asarray(ship_counts, dtype=np.int64) # int8 boards overflow
+    return ((N - 2 * ship_counts) / N) ** 2, n_qubits
+
+
+def _sample_scans(p_miss, n_qubits):
+    """
+    Samples scan results from each line's probability of measuring '00...0'.
+    
+    Args:
+        p_miss (np.ndarray): P(MISS) for each line.
+        n_qubits (int or np.ndarray): Number of qubits used by each line.
+        
+    Returns:
+        list: "DETECT" or "MISS" for each line, in order.
+    """
+    p_miss = np.asarray(p_miss, dtype=float)
+    
+    # We use multiple shots for a more reliable probabilistic result.
+    shots = np.broadcast_to(np.asarray(n_qubits) + 1, p_miss.shape)
+    draws = _RNG.random((len(p_miss), shots.max(initial=0))) < p_miss[:, None]
     
+    # Only the first `shots` draws of each line are used
+    draws &= np.arange(draws.shape[1]) < shots[:, None]
+    return [_scan_result(miss_counts, line_shots)
+            for miss_counts, line_shots in zip(draws.sum(axis=1).tolist(), shots.tolist())]
 
 
-def quantum_scan_line(line_data, draw=False):
+def simulate_scan_lines(lines):
+    """
+    Scans several lines with a single batched AerSimulator run.
+    
+    Submitting every circuit in one job pays the simulator's per-run
+    overhead once instead of once per line. Each circuit only needs one
+    simulator shot to save its exact P(MISS); the scan's shots are then
+    drawn from it.
+    
+    Args:
+        lines (list): Lines of 0s (miss) and 1s (ship).
+        
+    Returns:
+        list: "DETECT" or "MISS" for each line, in order.
+    """
+    # Empty lines and lines without ships always measure '00...0', so
+    # they are a trivial MISS and only the others are simulated
+    statuses = ["MISS"] * len(lines)
+    scanned = [i for i, line_data in enumerate(lines) if np.any(line_data)]
+    if not scanned:
+        return statuses
+
+    circuits, qubits = zip(*(build_scan_circuit(lines[i]) for i in scanned))
+    result = _SIM.run(list(circuits), shots=1).result()
+    p_miss = [result.data(j)["amplitudes_squared"][0] for j in range(len(scanned))]
+    
+    for i, status in zip(scanned, _sample_scans(p_miss, np.array(qubits))):
+        statuses[i] = status
+    return statuses
+
+
+def quantum_scan_line(line_data, draw=False, simulate=False):
     """
     Performs a single "Interaction-Free" quantum scan on a line.
     
@@ -49,90 +220,103 @@ def quantum_scan_line(line_data, draw=False):
     - If the measurement is |00...0>, no ship is present (MISS).
     - If the measurement is anything else, a ship is present (DETECT).
     
+    By default the measurements are sampled from the circuit's exact
+    output distribution instead of running the simulator.
+    
     Args:
-        line_data (list): A list of 0s (miss) and 1s (ship).
+        line_data (list or np.ndarray): A line of 0s (miss) and 1s (ship).
+        draw (bool): Print and return the circuit instead of scanning.
+        simulate (bool): Run the circuit on AerSimulator.
         
     Returns:
         str: "DETECT" or "MISS"
     """
     # Handle empty or single-item lines
-    if not line_data:
+    if len(line_data) == 0:
         return "MISS" # Cannot scan an empty line
         
     # Determine number of qubits needed to represent the line
-    n_qubits = math.ceil(math.log2(len(line_data)))
-    if n_qubits == 0: # Happens if len(line_data) == 1
-        n_qubits = 1
+    n_qubits = _num_qubits(len(line_data))
 
-    # --- Build the Circuit ---
-    qc = QuantumCircuit(n_qubits, n_qubits)
-    
-    # 1. Create superposition of all positions
-    qc.h(range(n_qubits))
-    
-    # 2. Apply the "bomb" oracle
-    oracle = create_oracle(line_data)
-    qc.append(oracle, range(n_qubits))
-    
-    # 3. Apply interference
-    qc.h(range(n_qubits))
-    
-    # 4. Measure
-    qc.measure(range(n_qubits), range(n_qubits))
-    
     if draw:
+        # Draw the circuit that simulate=True runs, measured for display
+        qc, _ = build_scan_circuit(line_data)
+        qc.measure_all()
         print(qc.draw())
         return qc
     
-    # --- Simulate ---
-    # We use multiple shots for a more reliable probabilistic result.
-    SHOTS = n_qubits + 1
-    simulator = AerSimulator()
-    t_qc = transpile(qc, simulator)
-    result = simulator.run(t_qc, shots=SHOTS).result()
-    counts = result.get_counts()
-    
-    # --- Interpret Result ---
-    # The "MISS" state is '00...0'
-    zero_state = '0' * n_qubits
+    # A line without ships always measures '00...0'
+    if not np.any(line_data):
+        return "MISS"
     
-    # Get the number of times we measured the "MISS" state
-    miss_counts = counts.get(zero_state, 0)
+    if simulate:
+        return simulate_scan_lines([line_data])[0]
+
+    # --- Analytical Shortcut ---
+    return _sample_scans(*_miss_probability([np.count_nonzero(line_data)], len(line_data)))[0]
+
+
+def scan_and_mark(board, known_board, simulate=False):
+    """
+    Scans every row and column of the board and rules out the MISS lines.
     
-    # If the number of "MISS" counts is less than the total shots,
-    # it means we must have measured *something else* at least once.
-    if miss_counts < SHOTS:
-        # Measuring *any* other state is a "DETECT"
-        return "DETECT"
+    Args:
+        board (np.ndarray): The hidden board of 0s (miss) and 1s (ship).
+        known_board (np.ndarray): The player's view as uint8 character
+            codes; squares on MISS lines are set to 'O' in place.
+        simulate (bool): Run the scans on AerSimulator.
+        
+    Returns:
+        tuple: "DETECT" or "MISS" for each row, and for each column.
+    """
+    n_rows, n_cols = board.shape
+    if simulate:
+        # Run every row and column scan as one batched simulator job
+        statuses = simulate_scan_lines(list(board) + list(board.T))
+        row_status, col_status = statuses[:n_rows], statuses[n_rows:]
     else:
-        # Only if all 100 shots were '00...0' do we call it a "MISS"
-        return "MISS"
+        # Only the number of ships on each line matters
+        row_status = _sample_scans(*_miss_probability(board.sum(axis=1), n_cols))
+        col_status = _sample_scans(*_miss_probability(board.sum(axis=0), n_rows))
+
+    # Update known board with 'MISS' info
+    known_board[np.array(row_status) == "MISS", :] = ord('O')
+    known_board[:, np.array(col_status) == "MISS"] = ord('O')
+    
+    return row_status, col_status
 
 # --- Game Logic ---
 
-def create_board(size, ship_list):
-    """Creates a simple game board."""
-    board = [[0 for _ in range(size)] for _ in range(size)]
-    for (r, c) in ship_list:
-        if 0 <= r < size and 0 <= c < size:
-            board[r][c] = 1
-    return board, set(ship_list)
+def create_board(size, ship_coords):
+    """Creates a simple game board as an int8 array of 0s and 1s."""
+    board = np.zeros((size, size), dtype=np.int8)
+    coords = np.array(list(ship_coords), dtype=np.intp).reshape(-1, 2)
+    on_board = ((coords >= 0) & (coords < size)).all(axis=1)
+    board[tuple(coords[on_board].T)] = 1
+    return board
+
+def _radar_chars(known_board):
+    """Converts the radar view's uint8 character codes to characters."""
+    return known_board.view("S1").astype(str)
+
 
 def print_board(board, title=""):
     """Helper function to print the board."""
-    print(f"\n--- {title} ---")
     size = len(board)
+    lines = [f"\n--- {title} ---"]
     
-    # Print column headers
-    header = "  | " + " | ".join([str(i) for i in range(size)]) + " |"
-    print(header)
-    print(" " + " -" * (size * 2 + 1))
+    # Column headers
+    lines.append("  | " + " | ".join([str(i) for i in range(size)]) + " |")
+    lines.append(" " + " -" * (size * 2 + 1))
     
-    # Print rows
+    # Rows
     for i, row in enumerate(board):
         row_str = " | ".join(map(str, row))
-        print(f"{i} | {row_str} |")
-    print(" " + " -" * (size * 2 + 1))
+        lines.append(f"{i} | {row_str} |")
+    lines.append(" " + " -" * (size * 2 + 1))
+    
+    # Print the whole board in one write
+    print("\n".join(lines))
 
 
 def place_ships(size, ship_lengths):
@@ -152,32 +336,23 @@ def place_ships(size, ship_lengths):
     for length in ship_lengths:
         placed = False
         for _ in range(max_retries):
-            orientation = random.choice(['horizontal', 'vertical'])
+            horizontal = random.getrandbits(1)
             
             # Choose a random starting position
-            if orientation == 'horizontal':
-                r = random.randint(0, size - 1)
-                c = random.randint(0, size - length)
+            if horizontal:
+                r = random.randrange(size)
+                c = random.randrange(size - length + 1)
             else: # vertical
-                r = random.randint(0, size - length)
-                c = random.randint(0, size - 1)
+                r = random.randrange(size - length + 1)
+                c = random.randrange(size)
                 
             # Check for overlap and bounds
-            new_ship = set()
-            valid_placement = True
-            for i in range(length):
-                if orientation == 'horizontal':
-                    coord = (r, c + i)
-                else:
-                    coord = (r + i, c)
-                
-                # Check overlap
-                if coord in ship_coords:
-                    valid_placement = False
-                    break
-                new_ship.add(coord)
+            if horizontal:
+                new_ship = tuple((r, c + i) for i in range(length))
+            else:
+                new_ship = tuple((r + i, c) for i in range(length))
             
-            if valid_placement:
+            if ship_coords.isdisjoint(new_ship):
                 ship_coords.update(new_ship)
                 placed = True
                 break # Move to next ship
@@ -188,8 +363,12 @@ def place_ships(size, ship_lengths):
     return ship_coords
 
 
-def play_quantum_battleship(SIZE = 8, SHIP_LENGTHS = [4, 3, 3, 2]):
-    """Main game simulation loop."""
+def play_quantum_battleship(SIZE = 8, SHIP_LENGTHS = [4, 3, 3, 2], simulate=False):
+    """
+    Main game simulation loop.
+    
+    Set simulate=True to run the quantum scans on AerSimulator.
+    """
     
     SHIP_COORDS = place_ships(SIZE, SHIP_LENGTHS)
     
@@ -197,20 +376,18 @@ def play_quantum_battleship(SIZE = 8, SHIP_LENGTHS = [4, 3, 3, 2]):
         print("Error: No ships were placed. Exiting.")
         return
     
-    hidden_board, ship_set = create_board(SIZE, SHIP_COORDS)
+    hidden_board = create_board(SIZE, SHIP_COORDS)
     
     # '?' = Unknown, 'O' = Miss, 'D' = Detected Line, 'X' = Confirmed Hit
-    known_board = [['?' for _ in range(SIZE)] for _ in range(SIZE)]
+    # Stored as uint8 character codes so whole lines can be stamped at once
+    known_board = np.full((SIZE, SIZE), ord('?'), dtype=np.uint8)
     
     print("Welcome to Quantum Battleship!")
     print(f"Board size: {SIZE}x{SIZE}")
-    print(f"Ships to find: {len(ship_set)} (from {len(SHIP_LENGTHS)} ships)")
-    print_board(hidden_board, "HIDDEN BOARD (FOR DEBUG)")
-    print_board(known_board, "YOUR RADAR VIEW")
-
-    row_status = ['?'] * SIZE
-    col_status = ['?'] * SIZE
-    total_quantum_scans = 0
+    print(f"Ships to find: {len(SHIP_COORDS)} (from {len(SHIP_LENGTHS)} ships)")
+    if VERBOSE:
+        print_board(hidden_board, "HIDDEN BOARD (FOR DEBUG)")
+    print_board(_radar_chars(known_board), "YOUR RADAR VIEW")
 
     # 2. Phase 1: Quantum Scanning
     print("\n--- Phase 1: Quantum Scanning ---")
@@ -218,79 +395,62 @@ def play_quantum_battleship(SIZE = 8, SHIP_LENGTHS = [4, 3, 3, 2]):
     print("Using Quantum Circuit : ")
     quantum_scan_line(hidden_board[0], draw=True)
     
-    # Scan Rows
-    print("Scanning all rows...")
-    for r in range(SIZE):
-        row_data = hidden_board[r]
-        row_status[r] = quantum_scan_line(row_data)
-        total_quantum_scans += 1
-        print(f"Row {r} scan result: {row_status[r]}")
-        
-        # Update known board with 'MISS' info
-        if row_status[r] == "MISS":
-            for c in range(SIZE):
-                known_board[r][c] = 'O'
-                
-    # Scan Columns
-    print("\nScanning all columns...")
-    for c in range(SIZE):
-        # Create column data
-        col_data = [hidden_board[r][c] for r in range(SIZE)]
-        col_status[c] = quantum_scan_line(col_data)
-        total_quantum_scans += 1
-        print(f"Col {c} scan result: {col_status[c]}")
-        
-        # Update known board with 'MISS' info
-        if col_status[c] == "MISS":
-            for r in range(SIZE):
-                known_board[r][c] = 'O'
+    row_status, col_status = scan_and_mark(hidden_board, known_board, simulate)
+    total_quantum_scans = len(row_status) + len(col_status)
+
+    # Report all scan results in one write
+    if VERBOSE:
+        lines = ["Scanning all rows..."]
+        lines += [f"Row {r} scan result: {row_status[r]}" for r in range(SIZE)]
+        lines.append("\nScanning all columns...")
+        lines += [f"Col {c} scan result: {col_status[c]}" for c in range(SIZE)]
+        sys.stdout.write("\n".join(lines) + "\n")
                 
-    print_board(known_board, "RADAR VIEW AFTER ALL SCANS")
+    print_board(_radar_chars(known_board), "RADAR VIEW AFTER ALL SCANS")
 
     # 3. Phase 2: Classical Pinpointing (The "Hits")
     print("\n--- Phase 2: Classical Pinpointing --- ", end="")
     
-    candidates = []
-    for r in range(SIZE):
-        for c in range(SIZE):
-            # A candidate is any square that hasn't been ruled out
-            # AND is at the intersection of a DETECTED row and column
-            if (row_status[r] == "DETECT" and 
-                col_status[c] == "DETECT" and 
-                known_board[r][c] == '?'):
-                
-                candidates.append((r, c))
-                known_board[r][c] = 'C' # Mark as Candidate
+    # A candidate is any square that hasn't been ruled out
+    # AND is at the intersection of a DETECTED row and column
+    row_mask = np.array([status == "DETECT" for status in row_status])
+    col_mask = np.array([status == "DETECT" for status in col_status])
+    cand_mask = np.outer(row_mask, col_mask) & (known_board == ord('?'))
+    
+    candidates = [tuple(rc) for rc in np.argwhere(cand_mask).tolist()]
+    known_board[cand_mask] = ord('C') # Mark as Candidate
 
     print(f"Identified {len(candidates)} candidate(s) for classical probing.")
-    print_board(known_board, "CANDIDATE VIEW")
+    print_board(_radar_chars(known_board), "CANDIDATE VIEW")
 
-    # This is the "E.V. Score"
-    total_hits = 0
-    ships_found = 0
-
-    for (r, c) in candidates:
-        print(f"Classically probing candidate at ({r}, {c})... ", end="")
-        total_hits += 1 # This is a "HIT" in the E.V. score
-        
-        if (r, c) in ship_set:
-            print("SUCCESSFUL HIT!")
-            known_board[r][c] = 'X'
-            ships_found += 1
-        else:
-            print("Final Miss.")
-            known_board[r][c] = 'O'
+    # Every probe is a "HIT" in the E.V. score
+    cand_set = set(candidates)
+    hits = cand_set & SHIP_COORDS
+    total_hits = len(cand_set)
+    ships_found = len(hits)
+    
+    # Mark every probed square as a final miss, then stamp the hits
+    known_board[cand_mask] = ord('O')
+    if hits:
+        known_board[tuple(np.array(list(hits)).T)] = ord('X')
+    
+    # Report all probes in one write
+    if VERBOSE and candidates:
+        lines = [f"Classically probing candidate at ({r}, {c})... "
+                 + ("SUCCESSFUL HIT!" if (r, c) in hits else "Final Miss.")
+                 for (r, c) in candidates]
+        sys.stdout.write("\n".join(lines) + "\n")
             
     # 4. Final Report
     print("\n--- GAME OVER ---")
-    print_board(known_board, "FINAL BOARD")
+    print_board(_radar_chars(known_board), "FINAL BOARD")
     
     print("--- STATISTICS ---")
     print(f"Total Quantum Scans: {total_quantum_scans}")
-    print(f"Ships Found:         {ships_found} / {len(ship_set)}")
+    print(f"Ships Found:         {ships_found} / {len(SHIP_COORDS)}")
     print(f"Elitzur-Vaidman (E.V.) Score (Total 'Hits'): {total_hits / (SIZE * SIZE)}")
 
-    if ships_found == len(ship_set):
+    if ships_found == len(SHIP_COORDS):
         print("\nAll ships found! Your Quantum Radar was a success!")
     else:
         print("\nNot all ships found. The classical board may have changed!")